@@ -3,9 +3,19 @@ import pandas as pd
 import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
+from functools import lru_cache
 import numpy as np
-from io import StringIO
+import pyarrow as pa
+import pyarrow.feather as feather
+from pyarrow import csv as pacsv
+from io import BytesIO
+import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 import time
 
 # Configuração da página
@@ -40,11 +50,78 @@ st.markdown("""
 # Configurações globais
 GOOGLE_SHEETS_ID = "1L0nO-rchxshEufLANyH3aEz6hFulvpq1OMPUzTw76LM"
 ETAPAS_FUNIL = ['SAL', 'SQL', 'OPP', 'BC', 'ONB_AGEND', 'ONB']
+ETAPA_DTYPE = pd.CategoricalDtype(ETAPAS_FUNIL, ordered=True)
+ETAPA_INDEX = {etapa: idx for idx, etapa in enumerate(ETAPAS_FUNIL)}
+# Faixas de urgência dos atrasos, da menor para a maior (limites inferiores em dias)
+URGENCIA_LIMITES = [3, 7, 14]
+URGENCIA_DTYPE = pd.CategoricalDtype(
+    ['🟢 Baixo (1-2 dias)', '🟡 Médio (3-6 dias)', '🟠 Alto (7-13 dias)', '🔴 Crítico (14+ dias)'],
+    ordered=True
+)
+DATA_TTL_SECONDS = 300  # Dados revalidados a cada 5 minutos
+DATE_COLUMNS = ['data_entrada', 'data_prevista_onboarding']
+DATA_CACHE_PATH = os.path.join(tempfile.gettempdir(), 'calculadora_pipeline_cax.feather')
+SHEET_NOT_MODIFIED = object()  # Resposta 304: a planilha não mudou desde o último download
+FALLBACK_DELAY_SECONDS = 3  # Espera pela URL preferida antes de disparar as alternativas
+RETRY_AFTER_MAX_SECONDS = 5  # Teto para a espera pedida pelo servidor no Retry-After
+AUTO_REFRESH_CHECK_SECONDS = 30  # Intervalo do timer que procura dados novos no snapshot
+TIMELINE_MAX_MONTHS = 120  # Acima disso a linha do tempo mostra só os meses com deals
 
-# Cache com TTL de 5 minutos
-@st.cache_data(ttl=300)
-def load_data():
-    """Carrega dados do Google Sheets com fallback robusto"""
+def parse_sheet_csv(content):
+    """Converte o CSV em DataFrame com o leitor multithread do Arrow"""
+    read_options = pacsv.ReadOptions(use_threads=True, block_size=1 << 20)
+    # Datas tipadas já na leitura: evita a segunda passada do pd.to_datetime
+    convert_options = pacsv.ConvertOptions(
+        column_types={col: pa.timestamp('ns') for col in DATE_COLUMNS},
+        strings_can_be_null=True
+    )
+    
+    try:
+        table = pacsv.read_csv(pa.BufferReader(content), read_options=read_options,
+                               convert_options=convert_options)
+    except pa.ArrowInvalid:
+        # Datas fora do ISO ou colunas com tipos mistos: volta para o parser do pandas
+        return pd.read_csv(BytesIO(content))
+    
+    # Cabeçalhos vazios ou repetidos: o Arrow os mantém como estão, o pandas os
+    # renomeia (Unnamed: N, col.1) e cada df[col] continua sendo uma Series
+    names = table.column_names
+    if len(set(names)) != len(names) or '' in names:
+        return pd.read_csv(BytesIO(content))
+    
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+class CappedRetry(Retry):
+    """Retry que respeita o Retry-After, mas nunca espera mais que RETRY_AFTER_MAX_SECONDS"""
+    
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, RETRY_AFTER_MAX_SECONDS)
+
+@st.cache_resource
+def get_http_session():
+    """Sessão HTTP compartilhada: reaproveita conexões TLS e repete falhas transitórias"""
+    session = requests.Session()
+    # Falha de conexão repete só uma vez: as URLs alternativas estão no mesmo host.
+    # Rate limit (429) e erros 5xx repetem com backoff exponencial, respeitando Retry-After
+    # com teto: o botão Recarregar e a primeira carga esperam a resposta de forma síncrona
+    retry = CappedRetry(total=3, connect=1, backoff_factor=0.5,
+                        status_forcelist=[429, 500, 502, 503, 504],
+                        allowed_methods=['GET'], respect_retry_after_header=True)
+    adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10, max_retries=retry)
+    session.mount('https://', adapter)
+    session.headers.update({
+        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+    })
+    return session
+
+def fetch_sheet_data(validators=None):
+    """Baixa e limpa os dados do Google Sheets (retorna None se nenhuma URL funcionar)
+    
+    Com `validators` (url -> headers condicionais do último download: If-None-Match
+    e/ou If-Modified-Since), faz um GET condicional e retorna SHEET_NOT_MODIFIED
+    quando o servidor responde 304; o dict é atualizado no lugar.
+    """
     
     urls_to_try = [
         f"https://docs.google.com/spreadsheets/d/{GOOGLE_SHEETS_ID}/export?format=csv&gid=0",
@@ -53,19 +130,53 @@ def load_data():
         f"https://docs.google.com/spreadsheets/d/{GOOGLE_SHEETS_ID}/gviz/tq?tqx=out:csv"
     ]
     
-    for i, url in enumerate(urls_to_try):
+    # A URL que respondeu por último (a que tem validadores) vai primeiro: é ela que pode
+    # responder 304 sem baixar o CSV
+    if validators:
+        urls_to_try.sort(key=lambda url: url not in validators)
+    
+    executor = ThreadPoolExecutor(max_workers=len(urls_to_try))
+    try:
+        return first_valid_sheet(request_sheet_urls(urls_to_try, validators, executor), validators)
+    finally:
+        # Não espera as URLs que ficaram para trás
+        executor.shutdown(wait=False)
+
+def request_sheet_urls(urls, validators, executor):
+    """Gera (url, future) em ordem de preferência, disparando as alternativas só quando preciso
+    
+    A URL preferida vai sozinha; as alternativas partem juntas (em paralelo) quando ela
+    falha ou não responde em FALLBACK_DELAY_SECONDS, sem somar os timeouts.
+    """
+    session = get_http_session()
+    
+    def submit(url):
+        headers = validators.get(url, {}) if validators else {}
+        # (connect, read): host inacessível falha rápido
+        return executor.submit(session.get, url, headers=headers, timeout=(3, 10))
+    
+    preferred = submit(urls[0])
+    wait([preferred], timeout=FALLBACK_DELAY_SECONDS)
+    fallbacks = None if preferred.done() else [submit(url) for url in urls[1:]]
+    yield urls[0], preferred
+    
+    if fallbacks is None:
+        fallbacks = [submit(url) for url in urls[1:]]
+    yield from zip(urls[1:], fallbacks)
+
+def first_valid_sheet(responses, validators=None):
+    """Limpa a primeira resposta válida de uma sequência (url, future) em ordem de preferência"""
+    for url, future in responses:
         try:
-            headers = {
-                'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            }
-            
-            response = requests.get(url, headers=headers, timeout=10)
+            response = future.result()
+            if response.status_code == 304:
+                return SHEET_NOT_MODIFIED
             response.raise_for_status()
             
-            if len(response.text) < 20:
+            if len(response.content) < 20:
                 continue
             
-            df = pd.read_csv(StringIO(response.text))
+            df = parse_sheet_csv(response.content)
             
             if df.empty or len(df.columns) < 2:
                 continue
@@ -73,10 +184,9 @@ def load_data():
             # Limpeza e formatação dos dados
             df.columns = df.columns.str.strip()
             
-            # Converte datas
-            date_columns = ['data_entrada', 'data_prevista_onboarding']
-            for col in date_columns:
-                if col in df.columns:
+            # Converte datas (apenas as que o Arrow não tipou na leitura)
+            for col in DATE_COLUMNS:
+                if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
                     df[col] = pd.to_datetime(df[col], errors='coerce')
             
             # Remove linhas vazias
@@ -93,17 +203,183 @@ def load_data():
                 df['etapa'] = df['etapa'].str.strip()
                 df = df[df['etapa'].isin(ETAPAS_FUNIL)]
             
-            st.success(f"✅ Dados carregados: {len(df)} registros do Google Sheets")
+            if validators is not None:
+                validators.clear()
+                conditional = {}
+                if response.headers.get('ETag'):
+                    conditional['If-None-Match'] = response.headers['ETag']
+                if response.headers.get('Last-Modified'):
+                    conditional['If-Modified-Since'] = response.headers['Last-Modified']
+                if conditional:
+                    validators[url] = conditional
+            
             return df
             
-        except Exception as e:
-            if i == len(urls_to_try) - 1:
-                st.warning("⚠️ Erro ao carregar Google Sheets. Usando dados de exemplo.")
-                return create_sample_data()
+        except Exception:
             continue
     
-    return create_sample_data()
+    return None
+
+def save_data_cache(df):
+    """Persiste os dados do Sheets em disco (Arrow IPC/Feather com lz4)"""
+    tmp_path = f"{DATA_CACHE_PATH}.{os.getpid()}.tmp"
+    try:
+        feather.write_feather(df, tmp_path, compression='lz4')
+        os.replace(tmp_path, DATA_CACHE_PATH)
+    except (OSError, ValueError, TypeError, pa.ArrowException):
+        # O cache em disco é só um atalho para o cold start: falhas (inclusive colunas
+        # que o Feather não serializa) são ignoradas e os dados novos seguem servidos
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def touch_data_cache():
+    """Renova a validade do cache em disco quando a planilha não mudou"""
+    try:
+        os.utime(DATA_CACHE_PATH)
+    except OSError:
+        pass
+
+def load_data_cache():
+    """Lê o cache em disco via memory map; retorna (df, mtime) ou (None, 0) se expirado"""
+    try:
+        saved_at = os.path.getmtime(DATA_CACHE_PATH)
+        if time.time() - saved_at > DATA_TTL_SECONDS:
+            return None, 0.0
+        
+        # Os buffers do Arrow mantêm o memory map aberto enquanto forem usados
+        source = pa.memory_map(DATA_CACHE_PATH)
+        table = pa.ipc.open_file(source).read_all()
+        return table.to_pandas(split_blocks=True), saved_at
+    except (OSError, pa.ArrowException):
+        return None, 0.0
+
+def prepare_data(df):
+    """Pré-calcula colunas derivadas uma única vez por carga"""
+    # Tipos estreitos: datas com precisão de segundos e inteiros no menor tipo possível
+    for col in DATE_COLUMNS:
+        if col in df.columns and pd.api.types.is_datetime64_dtype(df[col]):
+            df[col] = df[col].astype('datetime64[s]')
+    for col in df.select_dtypes('integer').columns:
+        df[col] = pd.to_numeric(df[col], downcast='integer')
+    
+    if 'data_entrada' in df.columns:
+        # Mês de entrada como chave inteira (ano * 12 + mês - 1), sem objetos Period por linha
+        entrada = df['data_entrada'].dt
+        df['mes_entrada'] = (entrada.year * 12 + entrada.month - 1).astype('Int32')
+    
+    # Colunas de baixa cardinalidade como categóricas: filtros, contagens e
+    # groupbys passam a operar sobre códigos inteiros
+    if 'etapa' in df.columns:
+        df['etapa'] = df['etapa'].astype(ETAPA_DTYPE)
+    if 'bdr' in df.columns:
+        df['bdr'] = df['bdr'].astype('category')
+    
+    return df
+
+class DataSnapshot:
+    """Último DataFrame válido, revalidado em segundo plano (stale-while-revalidate)"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.RLock()
+        self._refreshing = False
+        self.df = None
+        self.from_sheets = False
+        self.loaded_at = 0.0
+        self.version = 0  # Incrementado a cada troca de DataFrame (o auto-refresh compara)
+        self.validators = {}
+    
+    def load_initial(self):
+        """Primeira carga do processo: usa o cache em disco recente ou busca no Sheets"""
+        df, saved_at = load_data_cache()
+        if df is not None:
+            try:
+                df = prepare_data(df)
+            except Exception:
+                # Cache em disco que não pode ser preparado: ignora e busca no Sheets
+                df = None
+        if df is None:
+            self.refresh()
+            return
+        
+        with self._lock:
+            self.df, self.from_sheets = df, True
+            self.loaded_at = saved_at
+            self.version += 1
+    
+    def refresh(self):
+        """Busca os dados e troca o snapshot; em caso de falha mantém o último válido"""
+        try:
+            with self._fetch_lock:
+                # GET condicional só vale quando o snapshot atual veio do Sheets; os
+                # validadores novos ficam numa cópia até os dados serem aceitos
+                validators = dict(self.validators) if self.from_sheets else {}
+                df = fetch_sheet_data(validators)
+                if df is SHEET_NOT_MODIFIED:
+                    touch_data_cache()
+                    with self._lock:
+                        self.loaded_at = time.time()
+                    return
+                if df is not None:
+                    try:
+                        df = prepare_data(df)
+                    except Exception:
+                        # Dados que não podem ser preparados nunca vão para o disco
+                        # nem viram snapshot: mantém o último válido
+                        df = None
+                if df is not None:
+                    save_data_cache(df)
+                
+                with self._lock:
+                    if df is not None:
+                        self.df, self.from_sheets = df, True
+                        self.validators = validators
+                        self.version += 1
+                    elif self.df is None:
+                        self.df, self.from_sheets = prepare_data(create_sample_data()), False
+                        self.version += 1
+                    self.loaded_at = time.time()
+        finally:
+            self._refreshing = False
+    
+    def refresh_in_background(self):
+        """Dispara uma única revalidação em thread daemon"""
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self.refresh, daemon=True).start()
+    
+    def get(self):
+        """Retorna (df, from_sheets) imediatamente; só bloqueia na primeira carga"""
+        if self.df is None:
+            with self._fetch_lock:
+                if self.df is None:
+                    self.load_initial()
+        elif time.time() - self.loaded_at > DATA_TTL_SECONDS:
+            self.refresh_in_background()
+        
+        with self._lock:
+            return self.df, self.from_sheets
+
+@st.cache_resource
+def get_data_snapshot():
+    """Snapshot único compartilhado entre sessões e reruns"""
+    return DataSnapshot()
+
+def load_data():
+    """Carrega dados do Google Sheets com fallback robusto"""
+    df, from_sheets = get_data_snapshot().get()
+    
+    if from_sheets:
+        st.success(f"✅ Dados carregados: {len(df)} registros do Google Sheets")
+    else:
+        st.warning("⚠️ Erro ao carregar Google Sheets. Usando dados de exemplo.")
+    
+    # Cópia rasa: o snapshot é compartilhado e não deve ser alterado
+    return df.copy(deep=False)
 
+@st.cache_data(ttl=3600, show_spinner=False)
 def create_sample_data():
     """Cria dados de exemplo realistas para demonstração"""
     np.random.seed(42)  # Para dados consistentes
@@ -146,35 +422,37 @@ def create_sample_data():
     
     return pd.DataFrame(deals_data)
 
-def is_business_day(date):
-    """Verifica se é dia útil (Segunda a Sexta)"""
-    return date.weekday() < 5
-
 def add_business_days(start_date, business_days):
     """Adiciona dias úteis a uma data"""
-    current_date = start_date
-    days_added = 0
-    
-    while days_added < business_days:
-        current_date += timedelta(days=1)
-        if is_business_day(current_date):
-            days_added += 1
+    if business_days <= 0:
+        return start_date
     
-    return current_date
+    # roll='backward': partindo de um fim de semana, o próximo dia útil conta como o 1º
+    return np.busday_offset(np.datetime64(start_date, 'D'), business_days, roll='backward').tolist()
 
-def get_next_business_days(num_days=15):
+@lru_cache(maxsize=8)
+def business_days_after(start_date, num_days):
+    """Próximos `num_days` dias úteis após `start_date` (memoizado: muda só uma vez por dia)"""
+    start = np.datetime64(start_date, 'D')
+    return tuple(np.busday_offset(start, np.arange(1, num_days + 1), roll='backward').tolist())
+
+def get_next_business_days(num_days=15, today=None):
     """Retorna próximos dias úteis"""
-    business_days = []
-    current_date = datetime.now().date()
-    
-    while len(business_days) < num_days:
-        current_date += timedelta(days=1)
-        if is_business_day(current_date):
-            business_days.append(current_date)
-    
-    return business_days
+    return list(business_days_after(today or datetime.now().date(), num_days))
 
-def calculate_conversion_prediction(df, config, test_scenarios=None):
+def filter_deals(df, selected_bdr='Todos', selected_etapa='Todas'):
+    """Aplica os filtros de BDR e etapa com uma única máscara booleana"""
+    mask = np.ones(len(df), dtype=bool)
+    if selected_bdr != 'Todos' and 'bdr' in df.columns:
+        mask &= (df['bdr'] == selected_bdr).to_numpy()
+    if selected_etapa != 'Todas':
+        mask &= (df['etapa'] == selected_etapa).to_numpy()
+    
+    # Sem filtro efetivo não há por que materializar um novo DataFrame
+    return df if mask.all() else df[mask]
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def calculate_conversion_prediction(df, config, test_scenarios=None, today=None):
     """Calcula previsão detalhada de conversões"""
     if df.empty:
         return pd.DataFrame(), pd.DataFrame()
@@ -187,111 +465,138 @@ def calculate_conversion_prediction(df, config, test_scenarios=None):
         'SAL': 0.6, 'SQL': 0.7, 'OPP': 0.8, 'BC': 0.9, 'ONB_AGEND': 0.95, 'ONB': 1.0
     })
     
-    next_days = get_next_business_days(15)
-    results = []
-    detailed_results = []
+    # Etapa de cada deal como código inteiro; sem deals ativos nem cenários não há o que prever
+    n_stages = len(ETAPAS_FUNIL) - 1
+    stage_idx = pd.Categorical(df['etapa'], categories=ETAPAS_FUNIL).codes
+    active_rows = np.flatnonzero((stage_idx >= 0) & (stage_idx < n_stages))
+    if not len(active_rows) and not test_scenarios:
+        return pd.DataFrame(), pd.DataFrame()
+    
+    today = today or datetime.now().date()
+    next_days = get_next_business_days(15, today)
+    next_days_np = np.array(next_days, dtype='datetime64[D]')
+    next_days_set = frozenset(next_days)
     
-    # Processa deals existentes
-    for _, deal in df.iterrows():
-        if deal['etapa'] not in ETAPAS_FUNIL or deal['etapa'] == 'ONB':
-            continue
-        
-        base_date = datetime.now().date()
-        if pd.notna(deal.get('data_entrada')):
-            base_date = max(base_date, deal['data_entrada'].date())
-        
-        current_stage_idx = ETAPAS_FUNIL.index(deal['etapa'])
+    # Probabilidade acumulada e lead time total a partir de cada etapa, calculados
+    # uma vez por etapa (e não por deal), na mesma ordem de multiplicação
+    stage_probs = np.ones(n_stages)
+    stage_leads = np.zeros(n_stages, dtype=np.int64)
+    for start_idx in range(n_stages):
         probability = 1.0
-        
-        # Calcula probabilidade cumulativa
-        for stage_idx in range(current_stage_idx, len(ETAPAS_FUNIL)-1):
-            stage = ETAPAS_FUNIL[stage_idx]
+        for stage in ETAPAS_FUNIL[start_idx:n_stages]:
             probability *= conversion_rates.get(stage, 0.5)
-        
-        # Calcula lead time total
-        total_lead_time = sum([lead_times.get(ETAPAS_FUNIL[i], 2) for i in range(current_stage_idx, len(ETAPAS_FUNIL)-1)])
-        conversion_date = add_business_days(base_date, total_lead_time)
-        
-        if conversion_date in next_days:
-            results.append({
-                'data': conversion_date,
-                'conversoes_previstas': probability,
-                'total_deals': 1,
-                'tipo': 'Existente'
-            })
-            
-            detailed_results.append({
-                'data': conversion_date,
-                'deal': deal['dealname'],
-                'etapa_atual': deal['etapa'],
-                'probabilidade': probability,
-                'bdr': deal.get('bdr', 'N/A'),
-                'lead_time': total_lead_time,
-                'tipo': 'Existente'
-            })
+        stage_probs[start_idx] = probability
+        stage_leads[start_idx] = sum(lead_times.get(stage, 2) for stage in ETAPAS_FUNIL[start_idx:n_stages])
+    
+    # Processa deals existentes (vetorizado: datas em datetime64[D])
+    stage_idx = stage_idx[active_rows]
+    
+    today_np = np.datetime64(today, 'D')
+    if 'data_entrada' in df.columns:
+        entry_dates = df['data_entrada'].to_numpy()[active_rows].astype('datetime64[D]')
+        base_dates = np.where(np.isnat(entry_dates), today_np, np.maximum(entry_dates, today_np))
+    else:
+        base_dates = np.full(len(active_rows), today_np)
+    
+    # roll='backward': a partir de um fim de semana, o 1º dia útil seguinte conta como +1
+    deal_leads = stage_leads[stage_idx]
+    conversion_dates = np.where(
+        deal_leads == 0,
+        base_dates,
+        np.busday_offset(base_dates, deal_leads, roll='backward')
+    )
+    in_window = np.isin(conversion_dates, next_days_np)
+    
+    selected_rows = active_rows[in_window]
+    deal_dates = conversion_dates[in_window].astype(object)
+    deal_probs = stage_probs[stage_idx[in_window]]
+    
+    deals_detailed = pd.DataFrame({
+        'data': deal_dates,
+        'deal': df['dealname'].to_numpy()[selected_rows],
+        'etapa_atual': np.array(ETAPAS_FUNIL, dtype=object)[stage_idx[in_window]],
+        'probabilidade': deal_probs,
+        'bdr': df['bdr'].to_numpy(dtype=object)[selected_rows] if 'bdr' in df.columns else 'N/A',
+        'lead_time': deal_leads[in_window],
+        'tipo': 'Existente'
+    })
     
-    # Processa cenários de teste
+    # Processa cenários de teste: uma entrada por cenário (uma lista por coluna);
+    # as linhas por deal simulado são geradas depois com np.repeat
+    scenario_rows = {'data': [], 'nome': [], 'etapa': [], 'quantidade': [], 'probabilidade': [], 'bdr': [], 'lead_time': []}
     if test_scenarios:
         for scenario in test_scenarios:
             stage = scenario.get('etapa', 'SAL')
             quantity = scenario.get('quantidade', 1)
-            target_date = scenario.get('data_entrada', datetime.now().date())
+            target_date = scenario.get('data_entrada', today)
             scenario_name = scenario.get('nome', 'Teste')
             
-            if stage not in ETAPAS_FUNIL or stage == 'ONB':
+            if stage not in ETAPA_INDEX or stage == 'ONB':
                 continue
             
-            current_stage_idx = ETAPAS_FUNIL.index(stage)
-            probability = 1.0
-            
-            # Calcula probabilidade para cenário
-            for stage_idx in range(current_stage_idx, len(ETAPAS_FUNIL)-1):
-                current_stage = ETAPAS_FUNIL[stage_idx]
-                probability *= conversion_rates.get(current_stage, 0.5)
-            
-            # Lead time para cenário
-            total_lead_time = sum([lead_times.get(ETAPAS_FUNIL[i], 2) for i in range(current_stage_idx, len(ETAPAS_FUNIL)-1)])
+            # Probabilidade e lead time do cenário vêm das tabelas por etapa
+            current_stage_idx = ETAPA_INDEX[stage]
+            probability = stage_probs[current_stage_idx]
+            total_lead_time = int(stage_leads[current_stage_idx])
             conversion_date = add_business_days(target_date, total_lead_time)
             
-            if conversion_date in next_days:
-                total_scenario_conversions = quantity * probability
-                
-                results.append({
-                    'data': conversion_date,
-                    'conversoes_previstas': total_scenario_conversions,
-                    'total_deals': quantity,
-                    'tipo': 'Cenário'
-                })
-                
-                for i in range(quantity):
-                    detailed_results.append({
-                        'data': conversion_date,
-                        'deal': f"{scenario_name} #{i+1}",
-                        'etapa_atual': stage,
-                        'probabilidade': probability,
-                        'bdr': scenario.get('bdr', 'Cenário'),
-                        'lead_time': total_lead_time,
-                        'tipo': 'Cenário'
-                    })
-    
-    if not results:
+            if conversion_date in next_days_set:
+                scenario_rows['data'].append(conversion_date)
+                scenario_rows['nome'].append(scenario_name)
+                scenario_rows['etapa'].append(stage)
+                scenario_rows['quantidade'].append(quantity)
+                scenario_rows['probabilidade'].append(probability)
+                scenario_rows['bdr'].append(scenario.get('bdr', 'Cenário'))
+                scenario_rows['lead_time'].append(total_lead_time)
+    
+    quantities = np.array(scenario_rows['quantidade'], dtype=np.int64)
+    scenario_probs = np.array(scenario_rows['probabilidade'], dtype=float)
+    scenario_dates = np.array(scenario_rows['data'], dtype=object)
+    
+    # Um deal por unidade de quantidade, numerado 1..quantidade dentro de cada cenário
+    deal_numbers = np.arange(quantities.sum()) - np.repeat(np.cumsum(quantities) - quantities, quantities) + 1
+    scenario_names = np.repeat(np.array(scenario_rows['nome'], dtype=object), quantities)
+    scenarios_detailed = pd.DataFrame({
+        'data': np.repeat(scenario_dates, quantities),
+        'deal': [f"{name} #{number}" for name, number in zip(scenario_names, deal_numbers)],
+        'etapa_atual': np.repeat(np.array(scenario_rows['etapa'], dtype=object), quantities),
+        'probabilidade': np.repeat(scenario_probs, quantities),
+        'bdr': np.repeat(np.array(scenario_rows['bdr'], dtype=object), quantities),
+        'lead_time': np.repeat(np.array(scenario_rows['lead_time'], dtype=np.int64), quantities),
+        'tipo': 'Cenário'
+    })
+    
+    # Resumo diário: posição de cada linha (deal ou cenário) na janela de dias úteis
+    # e somas por dia com np.bincount, sem groupby
+    day_pos = np.searchsorted(next_days_np, np.concatenate([
+        conversion_dates[in_window],
+        np.array(scenario_rows['data'], dtype='datetime64[D]')
+    ]))
+    n_days = len(next_days_np)
+    has_rows = np.bincount(day_pos, minlength=n_days) > 0
+    if not has_rows.any():
         return pd.DataFrame(), pd.DataFrame()
     
-    # Cria DataFrame resumo
-    results_df = pd.DataFrame(results)
-    summary = results_df.groupby('data').agg({
-        'conversoes_previstas': 'sum',
-        'total_deals': 'sum'
-    }).round(2)
+    conversions_by_day = np.bincount(
+        day_pos, weights=np.concatenate([deal_probs, quantities * scenario_probs]), minlength=n_days
+    )
+    deals_by_day = np.bincount(
+        day_pos, weights=np.concatenate([np.ones(len(deal_probs)), quantities]), minlength=n_days
+    )
     
-    summary.columns = ['Conversões Previstas', 'Total Deals']
-    summary['Data'] = summary.index
-    summary['Dia Semana'] = summary['Data'].apply(lambda x: x.strftime('%A'))
-    summary['É Quarta'] = summary['Data'].apply(lambda x: x.weekday() == 2)
-    summary = summary[['Data', 'Dia Semana', 'É Quarta', 'Conversões Previstas', 'Total Deals']].reset_index(drop=True)
+    # Dia da semana calculado sobre a coluna inteira de uma vez (sem apply por linha)
+    summary_dates = pd.DatetimeIndex(next_days_np[has_rows])
+    summary = pd.DataFrame({
+        'Data': np.array(next_days, dtype=object)[has_rows],
+        'Dia Semana': summary_dates.day_name().to_numpy(),
+        'É Quarta': summary_dates.weekday.to_numpy() == 2,
+        'Conversões Previstas': conversions_by_day[has_rows].round(2),
+        'Total Deals': deals_by_day[has_rows].astype(np.int64)
+    })
     
     # DataFrame detalhado
-    detailed_df = pd.DataFrame(detailed_results)
+    detailed_parts = [part for part in (deals_detailed, scenarios_detailed) if not part.empty]
+    detailed_df = pd.concat(detailed_parts, ignore_index=True) if detailed_parts else pd.DataFrame()
     
     return summary, detailed_df
 
@@ -306,11 +611,9 @@ def safe_display_dataframe(df, title="", height=400):
     
     try:
         if 'É Quarta' in df.columns:
-            display_df = df.copy()
-            # Adiciona emoji para quartas-feiras
-            mask = display_df['É Quarta'] == True
-            display_df.loc[mask, 'Dia Semana'] = '🎯 ' + display_df.loc[mask, 'Dia Semana']
-            display_df = display_df.drop('É Quarta', axis=1)
+            # Adiciona emoji para quartas-feiras (vetorizado, sem cópia + .loc no DataFrame inteiro)
+            dia_semana = np.where(df['É Quarta'].to_numpy(dtype=bool), '🎯 ' + df['Dia Semana'], df['Dia Semana'])
+            display_df = df.drop(columns='É Quarta').assign(**{'Dia Semana': dia_semana})
             st.dataframe(display_df, use_container_width=True, height=height)
         else:
             st.dataframe(df, use_container_width=True, height=height)
@@ -319,80 +622,64 @@ def safe_display_dataframe(df, title="", height=400):
         st.warning(f"Problema na formatação: {str(e)[:50]}...")
         st.dataframe(df, use_container_width=True, height=height)
 
+@st.cache_resource(max_entries=32, show_spinner=False)
 def create_conversion_chart(df):
     """Cria gráfico avançado de conversões"""
     if df.empty:
         return None
     
-    fig = go.Figure()
-    
-    # Dias normais
-    normal_days = df[df['É Quarta'] == False]
-    if not normal_days.empty:
-        fig.add_trace(go.Bar(
-            x=normal_days['Data'],
-            y=normal_days['Conversões Previstas'],
-            name='Dias Úteis',
-            marker_color='#1f77b4',
-            hovertemplate='<b>%{x}</b><br>' +
-                         'Conversões: %{y:.1f}<br>' +
-                         'Deals: %{customdata}<br>' +
-                         '<extra></extra>',
-            customdata=normal_days['Total Deals']
-        ))
-    
-    # Quartas-feiras destacadas
-    wednesdays = df[df['É Quarta'] == True]
-    if not wednesdays.empty:
-        fig.add_trace(go.Bar(
-            x=wednesdays['Data'],
-            y=wednesdays['Conversões Previstas'],
-            name='🎯 Quartas-feiras (ONB)',
-            marker_color='#ff7f0e',
-            hovertemplate='<b>%{x} (Quarta-feira)</b><br>' +
-                         'Conversões: %{y:.1f}<br>' +
-                         'Deals: %{customdata}<br>' +
-                         '<extra></extra>',
-            customdata=wednesdays['Total Deals']
-        ))
+    # Um único trace: quartas-feiras destacadas pela cor de cada barra
+    is_wednesday = df['É Quarta'].to_numpy(dtype=bool)
+    fig = go.Figure(go.Bar(
+        x=df['Data'],
+        y=df['Conversões Previstas'],
+        name='Conversões',
+        marker_color=np.where(is_wednesday, '#ff7f0e', '#1f77b4'),
+        hovertemplate='<b>%{x}%{customdata[1]}</b><br>' +
+                     'Conversões: %{y:.1f}<br>' +
+                     'Deals: %{customdata[0]}<br>' +
+                     '<extra></extra>',
+        customdata=np.column_stack([
+            df['Total Deals'].to_numpy(),
+            np.where(is_wednesday, ' (Quarta-feira)', '')
+        ])
+    ))
     
     # Layout melhorado
     fig.update_layout(
         title={
-            'text': '📈 Previsão de Conversões - Próximos 15 Dias Úteis',
+            'text': '📈 Previsão de Conversões - Próximos 15 Dias Úteis'
+                    '<br><sup>🎯 Quartas-feiras (ONB) em laranja</sup>',
             'x': 0.5,
             'xanchor': 'center'
         },
         xaxis_title='Data',
         yaxis_title='Conversões Previstas',
         hovermode='x unified',
-        showlegend=True,
+        showlegend=False,
         height=500,
-        template='plotly_white'
+        template='plotly_white',
+        uirevision='conv_chart'  # Mantém zoom/legenda do usuário quando os dados mudam
     )
     
     return fig
 
-def create_funnel_chart(df):
-    """Cria gráfico de funil de vendas"""
-    if df.empty or 'etapa' not in df.columns:
+def create_funnel_chart(etapa_counts):
+    """Cria gráfico de funil de vendas a partir das contagens por etapa"""
+    if etapa_counts.empty:
         return None
     
-    # Conta deals por etapa
-    funnel_data = df['etapa'].value_counts()
-    
-    # Ordena pelas etapas do funil
-    ordered_stages = [stage for stage in ETAPAS_FUNIL if stage in funnel_data.index]
-    funnel_counts = [funnel_data[stage] for stage in ordered_stages]
+    # Ordena pelas etapas do funil com um único reindex (etapas sem deals ficam de fora)
+    funnel_counts = etapa_counts.reindex(ETAPAS_FUNIL).dropna().astype('int64')
     
     fig = go.Figure()
     
     fig.add_trace(go.Funnel(
-        y=ordered_stages,
-        x=funnel_counts,
+        y=funnel_counts.index,
+        x=funnel_counts.to_numpy(),
         textinfo="value+percent initial",
         marker=dict(
-            color=["#ff9999", "#66b3ff", "#99ff99", "#ffcc99", "#ff99cc", "#c2c2f0"][:len(ordered_stages)]
+            color=["#ff9999", "#66b3ff", "#99ff99", "#ffcc99", "#ff99cc", "#c2c2f0"][:len(funnel_counts)]
         )
     ))
     
@@ -402,66 +689,151 @@ def create_funnel_chart(df):
             'x': 0.5,
             'xanchor': 'center'
         },
-        height=400
+        height=400,
+        uirevision='funnel_chart'
     )
     
     return fig
 
-def get_deals_late(df):
+def create_stage_pie_chart(etapa_counts):
+    """Cria gráfico de pizza da distribuição por etapa"""
+    if etapa_counts.empty:
+        return None
+    
+    fig = go.Figure(go.Pie(
+        labels=etapa_counts.index.astype(str),
+        values=etapa_counts.to_numpy(),
+        marker=dict(colors=px.colors.qualitative.Set3)
+    ))
+    
+    fig.update_layout(title="📊 Distribuição Atual por Etapa", uirevision='stage_pie')
+    
+    return fig
+
+@st.cache_resource(max_entries=32)
+def get_stage_charts(counts_items):
+    """Reaproveita entre reruns os gráficos de funil e pizza para as mesmas contagens por etapa"""
+    etapa_counts = pd.Series(dict(counts_items), dtype='int64')
+    return create_funnel_chart(etapa_counts), create_stage_pie_chart(etapa_counts)
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_deals_late(df, today=None):
     """Identifica e classifica deals atrasados"""
     if df.empty or 'data_prevista_onboarding' not in df.columns:
         return pd.DataFrame()
     
-    today = datetime.now().date()
+    today = np.datetime64(today or datetime.now().date(), 'D')
     
-    # Filtra deals atrasados
-    late_deals = df[
-        (pd.notna(df['data_prevista_onboarding'])) &
-        (df['data_prevista_onboarding'].dt.date < today) &
-        (df['etapa'] != 'ONB')
-    ].copy()
+    # Datas previstas em dias (datetime64[D]): sem objetos date por linha; NaT nunca é < today
+    prevista = df['data_prevista_onboarding'].to_numpy().astype('datetime64[D]')
     
-    if late_deals.empty:
+    # Filtra deals atrasados
+    late_mask = (prevista < today) & (df['etapa'] != 'ONB').to_numpy()
+    if not late_mask.any():
         return pd.DataFrame()
     
     # Calcula dias de atraso
-    late_deals['dias_atraso'] = (today - late_deals['data_prevista_onboarding'].dt.date).dt.days
-    
-    # Classifica por urgência
-    def classify_urgency(days):
-        if days >= 14:
-            return '🔴 Crítico (14+ dias)'
-        elif days >= 7:
-            return '🟠 Alto (7-13 dias)'
-        elif days >= 3:
-            return '🟡 Médio (3-6 dias)'
-        else:
-            return '🟢 Baixo (1-2 dias)'
+    dias_atraso = (today - prevista[late_mask]).astype(np.int64)
     
-    late_deals['urgencia'] = late_deals['dias_atraso'].apply(classify_urgency)
+    # Classifica por urgência em uma única passada vetorizada: o código da faixa
+    # é a posição dos dias entre os limites (categórica ordenada, Crítico por último)
+    urgencia_codes = np.searchsorted(URGENCIA_LIMITES, dias_atraso, side='right')
     
-    # Prepara resultado
-    result = late_deals[[
-        'dealname', 'etapa', 'bdr', 'data_prevista_onboarding', 
-        'dias_atraso', 'urgencia'
-    ]].sort_values(['dias_atraso', 'dealname'], ascending=[False, True])
+    # Prepara resultado: só as colunas exibidas, sem copiar o frame inteiro
+    result = df.loc[late_mask, ['dealname', 'etapa', 'bdr', 'data_prevista_onboarding']].assign(
+        dias_atraso=dias_atraso,
+        urgencia=pd.Categorical.from_codes(urgencia_codes, dtype=URGENCIA_DTYPE)
+    ).sort_values(['dias_atraso', 'dealname'], ascending=[False, True])
     
     result.columns = ['Deal', 'Etapa', 'BDR', 'Data Prevista', 'Dias Atraso', 'Urgência']
     
     return result
 
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_bdr_summary(df):
+    """Resumo de deals e onboarding por BDR (tabela da aba de análises)"""
+    # Uma única agregação nomeada com funções nativas (sem lambda por grupo)
+    bdr_summary = df['etapa'].eq('ONB').groupby(df['bdr'], observed=True).agg(
+        **{'Total Deals': 'size', 'Onboarding': 'sum'}
+    )
+    bdr_summary['Taxa Sucesso (%)'] = bdr_summary['Onboarding'] / bdr_summary['Total Deals'] * 100
+    bdr_summary['Deals Ativos'] = bdr_summary['Total Deals'] - bdr_summary['Onboarding']
+    
+    # Reordena colunas
+    return bdr_summary[['Total Deals', 'Deals Ativos', 'Onboarding', 'Taxa Sucesso (%)']]
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_monthly_deals(df):
+    """Conta a entrada de deals por mês (índice no formato AAAA-MM)"""
+    keys = df['mes_entrada'].dropna().to_numpy(dtype=np.int64)
+    if not len(keys):
+        return pd.Series(dtype='int64')
+    
+    # Só os meses que ocorrem; se o intervalo for curto, série contínua com zeros nos meses
+    # sem deals. Uma data digitada errada (ex.: 1900) não gera milhares de meses vazios
+    month_keys, counts = np.unique(keys, return_counts=True)
+    if month_keys[-1] - month_keys[0] < TIMELINE_MAX_MONTHS:
+        first_key = month_keys[0]
+        counts = np.bincount(keys - first_key)
+        month_keys = np.arange(first_key, first_key + len(counts))
+    
+    months = [f"{key // 12}-{key % 12 + 1:02d}" for key in month_keys]
+    return pd.Series(counts, index=months)
+
+@st.cache_data(ttl=DATA_TTL_SECONDS, show_spinner=False)
+def get_late_by_bdr(late_deals):
+    """Quantidade, atraso médio e maior atraso por BDR"""
+    bdr_delays = late_deals.groupby('BDR', observed=True).agg({
+        'Dias Atraso': ['count', 'mean', 'max']
+    })
+    
+    bdr_delays.columns = ['Qtd Atrasados', 'Atraso Médio', 'Maior Atraso']
+    return bdr_delays
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def create_timeline_chart(monthly_deals):
+    """Cria gráfico de entrada de deals por mês"""
+    fig = go.Figure(go.Scatter(
+        x=monthly_deals.index.astype(str),
+        y=monthly_deals.to_numpy(),
+        mode='lines+markers',
+        hovertemplate='Mês=%{x}<br>Número de Deals=%{y}<extra></extra>'
+    ))
+    fig.update_layout(
+        title="📅 Entrada de Deals por Mês",
+        xaxis_title='Mês',
+        yaxis_title='Número de Deals',
+        height=400,
+        uirevision='timeline_chart'
+    )
+    
+    return fig
+
+@st.cache_resource(max_entries=32, show_spinner=False)
+def create_late_bdr_chart(bdr_delays):
+    """Cria gráfico de deals atrasados por BDR (cor pelo atraso médio)"""
+    fig = px.bar(
+        x=bdr_delays.index,
+        y=bdr_delays['Qtd Atrasados'],
+        title="📊 Quantidade de Deals Atrasados por BDR",
+        labels={'x': 'BDR', 'y': 'Deals Atrasados'},
+        color=bdr_delays['Atraso Médio'].round(1),
+        color_continuous_scale='Reds'
+    )
+    fig.update_layout(uirevision='delays_chart')
+    
+    return fig
+
+@st.cache_resource(max_entries=32, show_spinner=False)
 def create_bdr_performance_chart(df):
     """Cria gráfico de performance por BDR"""
     if df.empty or 'bdr' not in df.columns:
         return None
     
-    # Performance por BDR
-    bdr_stats = df.groupby('bdr').agg({
-        'etapa': 'count',
-        'dealname': lambda x: (df[df['bdr'] == x.iloc[0]]['etapa'] == 'ONB').sum() if not x.empty else 0
-    }).round(2)
-    
-    bdr_stats.columns = ['Total Deals', 'Onboarding']
+    # Performance por BDR: uma única agregação, sem varrer o DataFrame por grupo
+    bdr_stats = df['etapa'].eq('ONB').groupby(df['bdr'], observed=True).agg(
+        **{'Total Deals': 'size', 'Onboarding': 'sum'}
+    )
     bdr_stats['Taxa Conversão (%)'] = (bdr_stats['Onboarding'] / bdr_stats['Total Deals'] * 100).round(1)
     
     fig = go.Figure()
@@ -491,12 +863,379 @@ def create_bdr_performance_chart(df):
         yaxis=dict(title='Número de Deals', side='left'),
         yaxis2=dict(title='Taxa de Conversão (%)', side='right', overlaying='y'),
         height=400,
-        template='plotly_white'
+        template='plotly_white',
+        uirevision='bdr_chart'
     )
     
     return fig
 
+@st.fragment
+def render_previsoes_tab(df, config, bdr_options, today):
+    """Renderiza a aba de previsões de conversão"""
+    st.header("📅 Previsão de Conversões")
+    st.caption("Baseada em probabilidades e lead times configurados")
+    
+    # Filtros para previsões
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        selected_bdr = st.selectbox("👤 Filtrar por BDR", bdr_options)
+    
+    with col2:
+        etapas = ['Todas'] + ETAPAS_FUNIL
+        selected_etapa = st.selectbox("🎯 Filtrar por Etapa", etapas)
+    
+    with col3:
+        show_details = st.checkbox("📋 Mostrar detalhes", value=False)
+    
+    # Aplica filtros
+    filtered_df = filter_deals(df, selected_bdr, selected_etapa)
+    
+    # Calcula previsões
+    prediction_df, detailed_df = calculate_conversion_prediction(filtered_df, config, today=today)
+    
+    if not prediction_df.empty:
+        # Gráfico principal
+        chart = create_conversion_chart(prediction_df)
+        if chart:
+            st.plotly_chart(chart, use_container_width=True)
+        
+        # Tabela de previsões
+        safe_display_dataframe(prediction_df, "📊 Resumo de Previsões por Dia")
+        
+        # Detalhes se solicitado
+        if show_details and not detailed_df.empty:
+            st.subheader("🔍 Detalhes por Deal")
+            detailed_display = detailed_df[['data', 'deal', 'etapa_atual', 'probabilidade', 'bdr', 'lead_time']]
+            detailed_display.columns = ['Data', 'Deal', 'Etapa', 'Probabilidade', 'BDR', 'Lead Time']
+            st.dataframe(detailed_display, use_container_width=True)
+        
+        # Métricas de resumo
+        st.subheader("📊 Resumo Executivo")
+        
+        total_conversoes = prediction_df['Conversões Previstas'].sum()
+        quartas_conversoes = prediction_df[prediction_df['É Quarta'] == True]['Conversões Previstas'].sum()
+        
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            st.metric("🎯 Total Previsto", f"{total_conversoes:.1f}")
+        
+        with col2:
+            st.metric("📅 Em Quartas", f"{quartas_conversoes:.1f}")
+        
+        with col3:
+            if total_conversoes > 0:
+                perc_quartas = (quartas_conversoes / total_conversoes) * 100
+                st.metric("📊 % Quartas", f"{perc_quartas:.1f}%")
+            else:
+                st.metric("📊 % Quartas", "0%")
+        
+        with col4:
+            next_wednesday = next((d for d in prediction_df[prediction_df['É Quarta'] == True]['Data']), None)
+            if next_wednesday:
+                days_to_wednesday = (next_wednesday - today).days
+                st.metric("📅 Próxima Quarta", f"{days_to_wednesday} dias")
+            else:
+                st.metric("📅 Próxima Quarta", "N/A")
+    else:
+        st.info("📭 Nenhuma conversão prevista nos próximos 15 dias úteis com os filtros atuais")
+
+@st.fragment
+def render_cenarios_tab(df, config, today):
+    """Renderiza o simulador de cenários"""
+    st.header("🧪 Simulador de Cenários")
+    st.caption("Teste o impacto de novos deals no pipeline")
+    
+    # Formulário de cenários
+    with st.form("scenario_form", clear_on_submit=False):
+        st.subheader("Configurar Cenário")
+        
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            scenario_name = st.text_input("📝 Nome do Cenário", "Novo Cenário", 
+                                        help="Nome para identificar este cenário")
+            scenario_stage = st.selectbox("🎯 Etapa Inicial", ETAPAS_FUNIL[:-1], 
+                                        help="Em qual etapa os deals começam")
+            scenario_quantity = st.number_input("📊 Quantidade de Deals", 
+                                              min_value=1, max_value=100, value=5,
+                                              help="Quantos deals simular")
+        
+        with col2:
+            scenario_bdr = st.text_input("👤 BDR Responsável", "Cenário", 
+                                       help="BDR que trabalhará estes deals")
+            scenario_date = st.date_input("📅 Data de Entrada", today,
+                                        help="Quando os deals entram no pipeline")
+            
+            submit_scenario = st.form_submit_button("🚀 Simular Cenário", 
+                                                   help="Executar simulação")
+    
+    if submit_scenario:
+        # Configura cenário
+        test_scenarios = [{
+            'nome': scenario_name,
+            'etapa': scenario_stage,
+            'quantidade': scenario_quantity,
+            'bdr': scenario_bdr,
+            'data_entrada': scenario_date
+        }]
+        
+        # Executa simulação
+        scenario_prediction, scenario_detailed = calculate_conversion_prediction(
+            df, config, test_scenarios, today
+        )
+        
+        if not scenario_prediction.empty:
+            st.success(f"✅ Cenário '{scenario_name}' simulado com sucesso!")
+            
+            # Gráfico do cenário
+            chart = create_conversion_chart(scenario_prediction)
+            if chart:
+                st.plotly_chart(chart, use_container_width=True)
+            
+            # Tabela do cenário
+            safe_display_dataframe(scenario_prediction, f"📊 Resultado: {scenario_name}")
+            
+            # Impacto do cenário
+            col1, col2, col3 = st.columns(3)
+            
+            total_scenario = scenario_prediction['Conversões Previstas'].sum()
+            scenario_wednesdays = scenario_prediction[scenario_prediction['É Quarta'] == True]['Conversões Previstas'].sum()
+            
+            with col1:
+                st.metric("🎯 Conversões Previstas", f"{total_scenario:.1f}")
+            
+            with col2:
+                st.metric("📅 Em Quartas-feiras", f"{scenario_wednesdays:.1f}")
+            
+            with col3:
+                if total_scenario > 0:
+                    impact_percentage = (scenario_wednesdays / total_scenario) * 100
+                    st.metric("📊 Impacto Quartas", f"{impact_percentage:.1f}%")
+            
+            # Comparação com pipeline atual
+            current_prediction, _ = calculate_conversion_prediction(df, config, today=today)
+            if not current_prediction.empty:
+                current_total = current_prediction['Conversões Previstas'].sum()
+                increase = ((total_scenario / current_total) * 100) if current_total > 0 else 0
+                
+                st.info(f"📈 Este cenário representa um aumento de {increase:.1f}% nas conversões previstas")
+        else:
+            st.warning("⚠️ O cenário configurado não gera previsões no período analisado (15 dias úteis)")
+
+@st.fragment
+def render_deals_tab(df, bdr_options, now):
+    """Renderiza a gestão de deals"""
+    st.header("📋 Gestão de Deals")
+    
+    # Filtros para deals
+    col1, col2, col3 = st.columns(3)
+    
+    with col1:
+        bdr_filter = st.selectbox("👤 BDR", bdr_options, key="deals_bdr")
+    
+    with col2:
+        etapas_filter = ['Todas'] + ETAPAS_FUNIL
+        etapa_filter = st.selectbox("🎯 Etapa", etapas_filter, key="deals_etapa")
+    
+    with col3:
+        show_dates = st.checkbox("📅 Mostrar datas", value=True)
+    
+    # Aplica filtros (máscara única, sem cópia prévia do DataFrame)
+    deals_df = filter_deals(df, bdr_filter, etapa_filter)
+    
+    if not deals_df.empty:
+        # Prepara colunas para exibição
+        display_cols = ['dealname', 'etapa', 'bdr']
+        
+        if show_dates and 'data_entrada' in deals_df.columns:
+            display_cols.append('data_entrada')
+        if show_dates and 'data_prevista_onboarding' in deals_df.columns:
+            display_cols.append('data_prevista_onboarding')
+        
+        # Filtra colunas existentes
+        available_cols = [col for col in display_cols if col in deals_df.columns]
+        deals_display = deals_df.loc[:, available_cols]
+        
+        # Renomeia colunas no próprio frame (todas as colunas selecionadas estão no mapa)
+        column_rename = {
+            'dealname': 'Deal',
+            'etapa': 'Etapa',
+            'bdr': 'BDR',
+            'data_entrada': 'Data Entrada',
+            'data_prevista_onboarding': 'Data Prev. ONB'
+        }
+        deals_display.columns = [column_rename[col] for col in available_cols]
+        
+        # Ordena por etapa e nome (Etapa é categórica ordenada pelo funil: ordena pelos códigos)
+        if 'Etapa' in deals_display.columns:
+            deals_display = deals_display.sort_values(['Etapa', 'Deal'])
+        
+        safe_display_dataframe(deals_display, f"📊 {len(deals_display)} deals encontrados")
+        
+        # Estatísticas dos deals
+        if len(deals_display) > 0:
+            st.subheader("📈 Estatísticas dos Deals Filtrados")
+            
+            col1, col2, col3 = st.columns(3)
+            
+            with col1:
+                if 'Etapa' in deals_display.columns:
+                    most_common_stage = deals_display['Etapa'].value_counts().index[0]
+                    st.metric("📊 Etapa Mais Comum", most_common_stage)
+            
+            with col2:
+                if 'BDR' in deals_display.columns:
+                    most_active_bdr = deals_display['BDR'].value_counts().index[0]
+                    st.metric("👤 BDR Mais Ativo", most_active_bdr)
+            
+            with col3:
+                if 'Data Entrada' in deals_display.columns:
+                    # Idade calculada a cada rerun: o snapshot pode ter sido carregado há dias
+                    avg_age = (now - deals_df['data_entrada']).dt.days.mean()
+                    if pd.notna(avg_age):
+                        st.metric("⏱️ Idade Média", f"{int(avg_age)} dias")
+                    else:
+                        st.metric("⏱️ Idade Média", "N/A")
+    else:
+        st.info("📭 Nenhum deal encontrado com os filtros aplicados")
+
+@st.fragment
+def render_analises_tab(df, etapa_counts):
+    """Renderiza as análises avançadas"""
+    st.header("📊 Análises Avançadas")
+    
+    if not df.empty:
+        # Funil de vendas e distribuição por etapa (figuras em cache pelas contagens)
+        funnel_chart, fig_pie = get_stage_charts(
+            tuple(zip(etapa_counts.index.astype(str), etapa_counts.tolist()))
+        )
+        col1, col2 = st.columns(2)
+        
+        with col1:
+            if funnel_chart:
+                st.plotly_chart(funnel_chart, use_container_width=True)
+        
+        with col2:
+            # Distribuição por etapa (pizza)
+            if fig_pie:
+                st.plotly_chart(fig_pie, use_container_width=True)
+        
+        # Performance por BDR
+        if 'bdr' in df.columns:
+            bdr_chart = create_bdr_performance_chart(df)
+            if bdr_chart:
+                st.plotly_chart(bdr_chart, use_container_width=True)
+        
+        # Análise temporal
+        if 'data_entrada' in df.columns:
+            st.subheader("📈 Análise Temporal")
+            
+            # Entrada de deals por mês
+            monthly_deals = get_monthly_deals(df[['mes_entrada']])
+            if not monthly_deals.empty:
+                if len(monthly_deals) > 1:
+                    fig_timeline = create_timeline_chart(monthly_deals)
+                    st.plotly_chart(fig_timeline, use_container_width=True)
+                else:
+                    st.info("📊 Dados insuficientes para análise temporal (necessário pelo menos 2 meses)")
+        
+        # Tabela de resumo por BDR
+        if 'bdr' in df.columns:
+            st.subheader("👤 Performance Detalhada por BDR")
+            
+            bdr_summary = get_bdr_summary(df[['bdr', 'etapa']])
+            # Formatação feita pelo navegador, sem arredondar o DataFrame a cada rerun
+            st.dataframe(bdr_summary, use_container_width=True, column_config={
+                'Taxa Sucesso (%)': st.column_config.NumberColumn(format='%.1f')
+            })
+    else:
+        st.info("📭 Dados insuficientes para análises avançadas")
+
+@st.fragment
+def render_atrasados_tab(df, today):
+    """Renderiza os deals atrasados"""
+    st.header("🚨 Deals Atrasados")
+    st.caption("Deals que passaram da data prevista de onboarding")
+    
+    late_deals = get_deals_late(df, today)
+    
+    if not late_deals.empty:
+        # Métricas de atraso (todas sobre o mesmo array de dias, sem refiltrar o DataFrame)
+        dias_atraso = late_deals['Dias Atraso'].to_numpy()
+        # Quantidade por faixa de urgência em uma única contagem sobre os códigos
+        urgencias = URGENCIA_DTYPE.categories
+        urgencia_counts = np.bincount(late_deals['Urgência'].cat.codes, minlength=len(urgencias))
+        col1, col2, col3, col4 = st.columns(4)
+        
+        with col1:
+            total_late = len(dias_atraso)
+            st.metric("🚨 Total Atrasados", total_late)
+        
+        with col2:
+            critical_late = int(urgencia_counts[-1])
+            st.metric("🔴 Críticos", critical_late)
+        
+        with col3:
+            avg_delay = dias_atraso.mean()
+            st.metric("⏱️ Atraso Médio", f"{avg_delay:.1f} dias")
+        
+        with col4:
+            max_delay = dias_atraso.max()
+            st.metric("📈 Maior Atraso", f"{max_delay} dias")
+        
+        # Filtro por urgência: só as faixas presentes, da mais grave para a mais leve
+        urgency_filter = st.selectbox(
+            "🔍 Filtrar por Urgência:",
+            ['Todos'] + [urgencias[code] for code in np.flatnonzero(urgencia_counts)[::-1]]
+        )
+        
+        # Sem filtro a tabela é exibida direto (somente leitura, sem cópia)
+        if urgency_filter == 'Todos':
+            filtered_late = late_deals
+        else:
+            filtered_late = late_deals[late_deals['Urgência'] == urgency_filter]
+        
+        # Tabela de deals atrasados
+        safe_display_dataframe(filtered_late, 
+                             f"🚨 {len(filtered_late)} Deals Atrasados", 
+                             height=500)
+        
+        # Análise por BDR dos atrasos
+        if not late_deals.empty and 'BDR' in late_deals.columns:
+            st.subheader("👤 Atrasos por BDR")
+            
+            bdr_delays = get_late_by_bdr(late_deals[['BDR', 'Dias Atraso']])
+            st.dataframe(bdr_delays, use_container_width=True, column_config={
+                'Atraso Médio': st.column_config.NumberColumn(format='%.1f')
+            })
+            
+            # Gráfico de atrasos por BDR
+            fig_delays = create_late_bdr_chart(bdr_delays)
+            st.plotly_chart(fig_delays, use_container_width=True)
+    else:
+        st.success("🎉 Parabéns! Nenhum deal está atrasado no momento!")
+        st.balloons()
+
+@st.fragment(run_every=AUTO_REFRESH_CHECK_SECONDS)
+def auto_refresh_timer():
+    """Timer do auto-refresh: revalida dados vencidos e só dispara um rerun completo
+    quando o snapshot já tem dados mais novos que os exibidos"""
+    snapshot = get_data_snapshot()
+    if time.time() - snapshot.loaded_at > DATA_TTL_SECONDS:
+        snapshot.refresh_in_background()
+    if snapshot.version != st.session_state.get('data_version'):
+        st.rerun()
+
 def main():
+    # Versão dos dados deste rerun (lida antes da carga: no pior caso o timer do
+    # auto-refresh faz um rerun a mais, nunca deixa de exibir dados novos)
+    st.session_state['data_version'] = get_data_snapshot().version
+    
+    # Instante de referência único para todo o rerun (abas e rodapé)
+    now = datetime.now()
+    
     # Header principal
     st.markdown('<div class="main-header">', unsafe_allow_html=True)
     st.title("📊 Calculadora Pipeline CAX")
@@ -513,11 +1252,14 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("🔄 Recarregar", help="Atualiza dados do Google Sheets"):
-                st.cache_data.clear()
+                get_data_snapshot().refresh()
                 st.rerun()
         
         with col2:
-            auto_refresh = st.checkbox("Auto-refresh 5min", value=False, help="CUIDADO: Pode causar loops")
+            auto_refresh = st.checkbox("Auto-refresh 5min", value=False,
+                                       help="Atualiza o painel assim que houver dados novos (revalidados a cada 5 minutos)")
+            if auto_refresh:
+                auto_refresh_timer()
         
         st.divider()
         
@@ -560,8 +1302,9 @@ def main():
         
         st.divider()
         st.subheader("📊 Resumo Config")
-        st.metric("Lead Time Total", f"{total_lead_time} dias")
-        st.metric("Taxa Média", f"{avg_conversion:.1%}")
+        col1, col2 = st.columns(2)
+        col1.metric("Lead Time Total", f"{total_lead_time} dias")
+        col2.metric("Taxa Média", f"{avg_conversion:.1%}")
     
     # Carrega dados
     df = load_data()
@@ -570,31 +1313,32 @@ def main():
         st.error("❌ Erro crítico ao carregar dados")
         st.stop()
     
-    # Auto-refresh (cuidadoso)
-    if auto_refresh:
-        time.sleep(300)  # 5 minutos
-        st.rerun()
+    # Contagens por etapa: uma única passada, reutilizada pelas métricas e gráficos
+    etapa_counts = df['etapa'].value_counts(sort=False)
+    etapa_counts = etapa_counts[etapa_counts > 0]
     
     # Métricas principais
     st.subheader("📋 Métricas Principais")
     
     col1, col2, col3, col4, col5 = st.columns(5)
     
+    n_deals = len(df)
+    deals_onb = int(etapa_counts.get('ONB', 0))
+    total_deals = n_deals - deals_onb
+    
     with col1:
-        total_deals = len(df[df['etapa'] != 'ONB'])
         st.metric("📋 Deals Ativos", total_deals)
     
     with col2:
-        deals_onb = len(df[df['etapa'] == 'ONB'])
         st.metric("✅ Onboarding", deals_onb)
     
     with col3:
-        deals_bc = len(df[df['etapa'] == 'BC'])
+        deals_bc = int(etapa_counts.get('BC', 0))
         st.metric("🔥 Business Case", deals_bc)
     
     with col4:
         if total_deals > 0:
-            conversion_rate = (deals_onb / (total_deals + deals_onb)) * 100
+            conversion_rate = (deals_onb / n_deals) * 100
             st.metric("📊 Taxa Geral", f"{conversion_rate:.1f}%")
         else:
             st.metric("📊 Taxa Geral", "0%")
@@ -608,389 +1352,33 @@ def main():
         "📈 Previsões", "🧪 Cenários", "📋 Deals", "📊 Análises", "🚨 Atrasados"
     ])
     
+    # Configuração do algoritmo
+    config = {
+        'conversion_rates': conversion_rates,
+        'lead_times': lead_times
+    }
+    
+    # Data de referência única para todas as abas deste rerun
+    today = now.date()
+    
+    # Opções de BDR calculadas uma vez e compartilhadas pelos filtros das abas
+    bdr_options = ['Todos'] + list(df['bdr'].dropna().unique()) if 'bdr' in df.columns else ['Todos']
+    
+    # Cada aba é um fragmento: widgets internos reexecutam só a própria aba
     with tab1:
-        st.header("📅 Previsão de Conversões")
-        st.caption("Baseada em probabilidades e lead times configurados")
-        
-        # Filtros para previsões
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            bdrs = ['Todos'] + list(df['bdr'].dropna().unique()) if 'bdr' in df.columns else ['Todos']
-            selected_bdr = st.selectbox("👤 Filtrar por BDR", bdrs)
-        
-        with col2:
-            etapas = ['Todas'] + ETAPAS_FUNIL
-            selected_etapa = st.selectbox("🎯 Filtrar por Etapa", etapas)
-        
-        with col3:
-            show_details = st.checkbox("📋 Mostrar detalhes", value=False)
-        
-        # Aplica filtros
-        filtered_df = df.copy()
-        if selected_bdr != 'Todos' and 'bdr' in df.columns:
-            filtered_df = filtered_df[filtered_df['bdr'] == selected_bdr]
-        if selected_etapa != 'Todas':
-            filtered_df = filtered_df[filtered_df['etapa'] == selected_etapa]
-        
-        # Configuração do algoritmo
-        config = {
-            'conversion_rates': conversion_rates,
-            'lead_times': lead_times
-        }
-        
-        # Calcula previsões
-        prediction_df, detailed_df = calculate_conversion_prediction(filtered_df, config)
-        
-        if not prediction_df.empty:
-            # Gráfico principal
-            chart = create_conversion_chart(prediction_df)
-            if chart:
-                st.plotly_chart(chart, use_container_width=True)
-            
-            # Tabela de previsões
-            safe_display_dataframe(prediction_df, "📊 Resumo de Previsões por Dia")
-            
-            # Detalhes se solicitado
-            if show_details and not detailed_df.empty:
-                st.subheader("🔍 Detalhes por Deal")
-                detailed_display = detailed_df[['data', 'deal', 'etapa_atual', 'probabilidade', 'bdr', 'lead_time']].copy()
-                detailed_display.columns = ['Data', 'Deal', 'Etapa', 'Probabilidade', 'BDR', 'Lead Time']
-                st.dataframe(detailed_display, use_container_width=True)
-            
-            # Métricas de resumo
-            st.subheader("📊 Resumo Executivo")
-            
-            total_conversoes = prediction_df['Conversões Previstas'].sum()
-            quartas_conversoes = prediction_df[prediction_df['É Quarta'] == True]['Conversões Previstas'].sum()
-            
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                st.metric("🎯 Total Previsto", f"{total_conversoes:.1f}")
-            
-            with col2:
-                st.metric("📅 Em Quartas", f"{quartas_conversoes:.1f}")
-            
-            with col3:
-                if total_conversoes > 0:
-                    perc_quartas = (quartas_conversoes / total_conversoes) * 100
-                    st.metric("📊 % Quartas", f"{perc_quartas:.1f}%")
-                else:
-                    st.metric("📊 % Quartas", "0%")
-            
-            with col4:
-                next_wednesday = next((d for d in prediction_df[prediction_df['É Quarta'] == True]['Data']), None)
-                if next_wednesday:
-                    days_to_wednesday = (next_wednesday - datetime.now().date()).days
-                    st.metric("📅 Próxima Quarta", f"{days_to_wednesday} dias")
-                else:
-                    st.metric("📅 Próxima Quarta", "N/A")
-        else:
-            st.info("📭 Nenhuma conversão prevista nos próximos 15 dias úteis com os filtros atuais")
+        render_previsoes_tab(df, config, bdr_options, today)
     
     with tab2:
-        st.header("🧪 Simulador de Cenários")
-        st.caption("Teste o impacto de novos deals no pipeline")
-        
-        # Formulário de cenários
-        with st.form("scenario_form", clear_on_submit=False):
-            st.subheader("Configurar Cenário")
-            
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                scenario_name = st.text_input("📝 Nome do Cenário", "Novo Cenário", 
-                                            help="Nome para identificar este cenário")
-                scenario_stage = st.selectbox("🎯 Etapa Inicial", ETAPAS_FUNIL[:-1], 
-                                            help="Em qual etapa os deals começam")
-                scenario_quantity = st.number_input("📊 Quantidade de Deals", 
-                                                  min_value=1, max_value=100, value=5,
-                                                  help="Quantos deals simular")
-            
-            with col2:
-                scenario_bdr = st.text_input("👤 BDR Responsável", "Cenário", 
-                                           help="BDR que trabalhará estes deals")
-                scenario_date = st.date_input("📅 Data de Entrada", datetime.now().date(),
-                                            help="Quando os deals entram no pipeline")
-                
-                submit_scenario = st.form_submit_button("🚀 Simular Cenário", 
-                                                       help="Executar simulação")
-        
-        if submit_scenario:
-            # Configura cenário
-            test_scenarios = [{
-                'nome': scenario_name,
-                'etapa': scenario_stage,
-                'quantidade': scenario_quantity,
-                'bdr': scenario_bdr,
-                'data_entrada': scenario_date
-            }]
-            
-            # Executa simulação
-            scenario_prediction, scenario_detailed = calculate_conversion_prediction(
-                df, config, test_scenarios
-            )
-            
-            if not scenario_prediction.empty:
-                st.success(f"✅ Cenário '{scenario_name}' simulado com sucesso!")
-                
-                # Gráfico do cenário
-                chart = create_conversion_chart(scenario_prediction)
-                if chart:
-                    st.plotly_chart(chart, use_container_width=True)
-                
-                # Tabela do cenário
-                safe_display_dataframe(scenario_prediction, f"📊 Resultado: {scenario_name}")
-                
-                # Impacto do cenário
-                col1, col2, col3 = st.columns(3)
-                
-                total_scenario = scenario_prediction['Conversões Previstas'].sum()
-                scenario_wednesdays = scenario_prediction[scenario_prediction['É Quarta'] == True]['Conversões Previstas'].sum()
-                
-                with col1:
-                    st.metric("🎯 Conversões Previstas", f"{total_scenario:.1f}")
-                
-                with col2:
-                    st.metric("📅 Em Quartas-feiras", f"{scenario_wednesdays:.1f}")
-                
-                with col3:
-                    if total_scenario > 0:
-                        impact_percentage = (scenario_wednesdays / total_scenario) * 100
-                        st.metric("📊 Impacto Quartas", f"{impact_percentage:.1f}%")
-                
-                # Comparação com pipeline atual
-                current_prediction, _ = calculate_conversion_prediction(df, config)
-                if not current_prediction.empty:
-                    current_total = current_prediction['Conversões Previstas'].sum()
-                    increase = ((total_scenario / current_total) * 100) if current_total > 0 else 0
-                    
-                    st.info(f"📈 Este cenário representa um aumento de {increase:.1f}% nas conversões previstas")
-            else:
-                st.warning("⚠️ O cenário configurado não gera previsões no período analisado (15 dias úteis)")
+        render_cenarios_tab(df, config, today)
     
     with tab3:
-        st.header("📋 Gestão de Deals")
-        
-        # Filtros para deals
-        col1, col2, col3 = st.columns(3)
-        
-        with col1:
-            bdrs_filter = ['Todos'] + list(df['bdr'].dropna().unique()) if 'bdr' in df.columns else ['Todos']
-            bdr_filter = st.selectbox("👤 BDR", bdrs_filter, key="deals_bdr")
-        
-        with col2:
-            etapas_filter = ['Todas'] + ETAPAS_FUNIL
-            etapa_filter = st.selectbox("🎯 Etapa", etapas_filter, key="deals_etapa")
-        
-        with col3:
-            show_dates = st.checkbox("📅 Mostrar datas", value=True)
-        
-        # Aplica filtros
-        deals_df = df.copy()
-        if bdr_filter != 'Todos' and 'bdr' in df.columns:
-            deals_df = deals_df[deals_df['bdr'] == bdr_filter]
-        if etapa_filter != 'Todas':
-            deals_df = deals_df[deals_df['etapa'] == etapa_filter]
-        
-        if not deals_df.empty:
-            # Prepara colunas para exibição
-            display_cols = ['dealname', 'etapa', 'bdr']
-            
-            if show_dates and 'data_entrada' in deals_df.columns:
-                display_cols.append('data_entrada')
-            if show_dates and 'data_prevista_onboarding' in deals_df.columns:
-                display_cols.append('data_prevista_onboarding')
-            
-            # Filtra colunas existentes
-            available_cols = [col for col in display_cols if col in deals_df.columns]
-            deals_display = deals_df[available_cols].copy()
-            
-            # Renomeia colunas
-            column_rename = {
-                'dealname': 'Deal',
-                'etapa': 'Etapa',
-                'bdr': 'BDR',
-                'data_entrada': 'Data Entrada',
-                'data_prevista_onboarding': 'Data Prev. ONB'
-            }
-            deals_display = deals_display.rename(columns=column_rename)
-            
-            # Ordena por etapa e nome
-            if 'Etapa' in deals_display.columns:
-                etapa_order = {etapa: i for i, etapa in enumerate(ETAPAS_FUNIL)}
-                deals_display['_sort_order'] = deals_display['Etapa'].map(etapa_order)
-                deals_display = deals_display.sort_values(['_sort_order', 'Deal'])
-                deals_display = deals_display.drop('_sort_order', axis=1)
-            
-            safe_display_dataframe(deals_display, f"📊 {len(deals_display)} deals encontrados")
-            
-            # Estatísticas dos deals
-            if len(deals_display) > 0:
-                st.subheader("📈 Estatísticas dos Deals Filtrados")
-                
-                col1, col2, col3 = st.columns(3)
-                
-                with col1:
-                    if 'Etapa' in deals_display.columns:
-                        most_common_stage = deals_display['Etapa'].mode().iloc[0] if not deals_display.empty else 'N/A'
-                        st.metric("📊 Etapa Mais Comum", most_common_stage)
-                
-                with col2:
-                    if 'BDR' in deals_display.columns:
-                        most_active_bdr = deals_display['BDR'].mode().iloc[0] if not deals_display.empty else 'N/A'
-                        st.metric("👤 BDR Mais Ativo", most_active_bdr)
-                
-                with col3:
-                    if 'Data Entrada' in deals_display.columns:
-                        try:
-                            avg_age = (datetime.now() - pd.to_datetime(deals_display['Data Entrada']).mean()).days
-                            st.metric("⏱️ Idade Média", f"{avg_age} dias")
-                        except:
-                            st.metric("⏱️ Idade Média", "N/A")
-        else:
-            st.info("📭 Nenhum deal encontrado com os filtros aplicados")
+        render_deals_tab(df, bdr_options, now)
     
     with tab4:
-        st.header("📊 Análises Avançadas")
-        
-        if not df.empty:
-            # Funil de vendas
-            col1, col2 = st.columns(2)
-            
-            with col1:
-                funnel_chart = create_funnel_chart(df)
-                if funnel_chart:
-                    st.plotly_chart(funnel_chart, use_container_width=True)
-            
-            with col2:
-                # Distribuição por etapa (pizza)
-                etapa_counts = df['etapa'].value_counts()
-                fig_pie = px.pie(
-                    values=etapa_counts.values,
-                    names=etapa_counts.index,
-                    title="📊 Distribuição Atual por Etapa",
-                    color_discrete_sequence=px.colors.qualitative.Set3
-                )
-                st.plotly_chart(fig_pie, use_container_width=True)
-            
-            # Performance por BDR
-            if 'bdr' in df.columns:
-                bdr_chart = create_bdr_performance_chart(df)
-                if bdr_chart:
-                    st.plotly_chart(bdr_chart, use_container_width=True)
-            
-            # Análise temporal
-            if 'data_entrada' in df.columns:
-                st.subheader("📈 Análise Temporal")
-                
-                df_with_dates = df.dropna(subset=['data_entrada'])
-                if not df_with_dates.empty:
-                    # Entrada de deals por mês
-                    df_with_dates['mes_entrada'] = df_with_dates['data_entrada'].dt.to_period('M')
-                    monthly_deals = df_with_dates.groupby('mes_entrada').size()
-                    
-                    if len(monthly_deals) > 1:
-                        fig_timeline = px.line(
-                            x=monthly_deals.index.astype(str),
-                            y=monthly_deals.values,
-                            title="📅 Entrada de Deals por Mês",
-                            labels={'x': 'Mês', 'y': 'Número de Deals'},
-                            markers=True
-                        )
-                        fig_timeline.update_layout(height=400)
-                        st.plotly_chart(fig_timeline, use_container_width=True)
-                    else:
-                        st.info("📊 Dados insuficientes para análise temporal (necessário pelo menos 2 meses)")
-            
-            # Tabela de resumo por BDR
-            if 'bdr' in df.columns:
-                st.subheader("👤 Performance Detalhada por BDR")
-                
-                bdr_summary = df.groupby('bdr').agg({
-                    'etapa': ['count', lambda x: (x == 'ONB').sum()],
-                    'dealname': 'count'
-                }).round(2)
-                
-                bdr_summary.columns = ['Total Deals', 'Onboarding', 'Count']
-                bdr_summary = bdr_summary.drop('Count', axis=1)
-                bdr_summary['Taxa Sucesso (%)'] = (bdr_summary['Onboarding'] / bdr_summary['Total Deals'] * 100).round(1)
-                bdr_summary['Deals Ativos'] = bdr_summary['Total Deals'] - bdr_summary['Onboarding']
-                
-                # Reordena colunas
-                bdr_summary = bdr_summary[['Total Deals', 'Deals Ativos', 'Onboarding', 'Taxa Sucesso (%)']]
-                
-                st.dataframe(bdr_summary, use_container_width=True)
-        else:
-            st.info("📭 Dados insuficientes para análises avançadas")
+        render_analises_tab(df, etapa_counts)
     
     with tab5:
-        st.header("🚨 Deals Atrasados")
-        st.caption("Deals que passaram da data prevista de onboarding")
-        
-        late_deals = get_deals_late(df)
-        
-        if not late_deals.empty:
-            # Métricas de atraso
-            col1, col2, col3, col4 = st.columns(4)
-            
-            with col1:
-                total_late = len(late_deals)
-                st.metric("🚨 Total Atrasados", total_late)
-            
-            with col2:
-                critical_late = len(late_deals[late_deals['Urgência'].str.contains('Crítico')])
-                st.metric("🔴 Críticos", critical_late)
-            
-            with col3:
-                avg_delay = late_deals['Dias Atraso'].mean()
-                st.metric("⏱️ Atraso Médio", f"{avg_delay:.1f} dias")
-            
-            with col4:
-                max_delay = late_deals['Dias Atraso'].max()
-                st.metric("📈 Maior Atraso", f"{max_delay} dias")
-            
-            # Filtro por urgência
-            urgency_filter = st.selectbox(
-                "🔍 Filtrar por Urgência:",
-                ['Todos'] + list(late_deals['Urgência'].unique())
-            )
-            
-            filtered_late = late_deals.copy()
-            if urgency_filter != 'Todos':
-                filtered_late = filtered_late[filtered_late['Urgência'] == urgency_filter]
-            
-            # Tabela de deals atrasados
-            safe_display_dataframe(filtered_late, 
-                                 f"🚨 {len(filtered_late)} Deals Atrasados", 
-                                 height=500)
-            
-            # Análise por BDR dos atrasos
-            if not late_deals.empty and 'BDR' in late_deals.columns:
-                st.subheader("👤 Atrasos por BDR")
-                
-                bdr_delays = late_deals.groupby('BDR').agg({
-                    'Dias Atraso': ['count', 'mean', 'max']
-                }).round(1)
-                
-                bdr_delays.columns = ['Qtd Atrasados', 'Atraso Médio', 'Maior Atraso']
-                
-                st.dataframe(bdr_delays, use_container_width=True)
-                
-                # Gráfico de atrasos por BDR
-                fig_delays = px.bar(
-                    x=bdr_delays.index,
-                    y=bdr_delays['Qtd Atrasados'],
-                    title="📊 Quantidade de Deals Atrasados por BDR",
-                    labels={'x': 'BDR', 'y': 'Deals Atrasados'},
-                    color=bdr_delays['Atraso Médio'],
-                    color_continuous_scale='Reds'
-                )
-                st.plotly_chart(fig_delays, use_container_width=True)
-        else:
-            st.success("🎉 Parabéns! Nenhum deal está atrasado no momento!")
-            st.balloons()
+        render_atrasados_tab(df, today)
     
     # Footer informativo
     st.divider()
@@ -999,7 +1387,7 @@ def main():
     
     with col1:
         st.caption("🔄 Última atualização dos dados")
-        st.caption(datetime.now().strftime('%d/%m/%Y %H:%M:%S'))
+        st.caption(now.strftime('%d/%m/%Y %H:%M:%S'))
     
     with col2:
         st.caption("📊 Fonte dos dados")
@@ -1007,11 +1395,11 @@ def main():
     
     with col3:
         st.caption("🎯 Total de registros")
-        st.caption(f"{len(df)} deals no pipeline")
+        st.caption(f"{n_deals} deals no pipeline")
     
     with col4:
         st.caption("⚙️ Configuração atual")
-        st.caption(f"Lead time: {sum(lead_times.values())} dias")
+        st.caption(f"Lead time: {total_lead_time} dias")
 
 if __name__ == "__main__":
     main()